@@ -1,17 +1,32 @@
+from typing import Optional
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import END, StateGraph
 
-from agent.nodes import decision_maker, execute_click, execute_command, execute_type, execute_wait, fail_node, next_step, should_continue, success_node
-from agent.state import AgentState
+from agent.nodes import (
+    decision_maker,
+    execute_batch,
+    execute_click,
+    execute_command,
+    execute_type,
+    execute_wait,
+    fail_node,
+    next_step,
+    should_continue,
+    success_node,
+)
+from agent.state import AgentContext, AgentState
 
 
-def create_agent_graph():
-    workflow = StateGraph(AgentState)
+def create_agent_graph(checkpointer: Optional[BaseCheckpointSaver] = None):
+    workflow = StateGraph(AgentState, context_schema=AgentContext)
 
     workflow.add_node("decision_node", decision_maker)
     workflow.add_node("click_node", execute_click)
     workflow.add_node("type_node", execute_type)
     workflow.add_node("command_node", execute_command)
     workflow.add_node("wait_node", execute_wait)
+    workflow.add_node("batch_node", execute_batch)
     workflow.add_node("next_step_node", next_step)
     workflow.add_node("success_node", success_node)
     workflow.add_node("fail_node", fail_node)
@@ -39,6 +54,7 @@ def create_agent_graph():
             "type_node": "type_node",
             "command_node": "command_node",
             "wait_node": "wait_node",
+            "batch_node": "batch_node",
             "decision_node": "decision_node",
             "success_node": "success_node",
             "fail_node": "fail_node",
@@ -50,8 +66,9 @@ def create_agent_graph():
     workflow.add_edge("type_node", "next_step_node")
     workflow.add_edge("command_node", "next_step_node")
     workflow.add_edge("wait_node", "next_step_node")
+    workflow.add_edge("batch_node", "next_step_node")
 
     workflow.add_edge("success_node", END)
     workflow.add_edge("fail_node", END)
 
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
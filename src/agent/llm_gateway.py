@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import CONFIG
+from utils.log import log_event
+
+
+class LLMGateway:
+    """Общая для всех запусков процесса точка вызова LLM: лимит частоты, лимит параллельных запросов
+    с приоритетом по дедлайну и склейка одинаковых одновременных запросов."""
+
+    def __init__(self, max_concurrency: int = 0, requests_per_minute: int = 0, burst: int = 1, coalesce: bool = True):
+        # 0 означает отсутствие ограничения
+        self.max_concurrency = max_concurrency
+        self.rate = requests_per_minute / 60
+        self.burst = max(1, burst)
+        self.coalesce = coalesce
+
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._active = 0
+        # Ожидающие слота: (дедлайн, порядок, future) - первым получает слот запуск с ближайшим дедлайном
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.calls = 0
+        self.coalesced = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    @staticmethod
+    def request_key(schema: str, messages: list) -> str:
+        digest = hashlib.sha1(schema.encode("utf-8"))
+        for message in messages:
+            digest.update(json.dumps(message.content, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    async def invoke(self, llm, messages: list, key: Optional[str] = None, deadline: Optional[float] = None, name: str = "llm"):
+        if not (self.coalesce and key):
+            return await self._call(llm, messages, deadline, name)
+
+        shared = self._inflight.get(key)
+        if shared:
+            try:
+                result = await asyncio.shield(shared)
+                self.coalesced += 1
+                log_event("llm_gateway", name=name, coalesced=True, queue_wait=0.0)
+                return result
+            except asyncio.CancelledError:
+                # Исходный запрос отменили вместе с его запуском - выполняем свой
+                if not shared.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._call(llm, messages, deadline, name)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Ошибку получат присоединившиеся запросы; без них она не должна считаться потерянной
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _call(self, llm, messages: list, deadline: Optional[float], name: str):
+        queued_at = time.monotonic()
+        await self._acquire(deadline)
+        try:
+            await self._take_token()
+            queue_wait = time.monotonic() - queued_at
+            self.calls += 1
+            self.total_queue_wait += queue_wait
+            self.max_queue_wait = max(self.max_queue_wait, queue_wait)
+            log_event("llm_gateway", name=name, coalesced=False, queue_wait=queue_wait, active=self._active, queued=len(self._waiters))
+            return await llm.ainvoke(messages)
+        finally:
+            self._release()
+
+    async def _acquire(self, deadline: Optional[float]) -> None:
+        if not self.max_concurrency:
+            return
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (deadline if deadline is not None else math.inf, next(self._order), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже передан этому запросу - отдаем его следующему
+                self._release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release(self) -> None:
+        if not self.max_concurrency:
+            return
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Слот переходит ожидающему без изменения счетчика активных
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    async def _take_token(self) -> None:
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "queue_wait_avg": self.total_queue_wait / self.calls if self.calls else 0.0,
+            "queue_wait_max": self.max_queue_wait,
+            "active": self._active,
+            "queued": len(self._waiters),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_gateway() -> LLMGateway:
+    config = CONFIG.gateway
+    return LLMGateway(config.max_concurrency, config.requests_per_minute, config.burst, config.coalesce)
@@ -1,31 +1,60 @@
-from typing import Union, List
+from typing import Annotated, List, Literal, Union
 
 from pydantic import BaseModel, Field
 
 
 class ClickAction(BaseModel):
-    action: str = Field("click_element", description="Тип действия")
+    action: Literal["click_element"] = Field(..., description="Тип действия")
     element_description: str = Field(..., description="Описание элемента")
     x: int = Field(..., description="Координата X")
     y: int = Field(..., description="Координата Y")
+    small: bool = Field(False, description="Мелкий элемент: иконка, чекбокс, ссылка в тексте")
 
 
 class TypeAction(BaseModel):
-    action: str = Field("type", description="Тип действия")
+    action: Literal["type"] = Field(..., description="Тип действия")
     text: str = Field(..., description="Текст для ввода")
 
 
 class CommandAction(BaseModel):
-    action: str = Field("command", description="Тип действия")
+    action: Literal["command"] = Field(..., description="Тип действия")
     command: str = Field(..., description="Команда/клавиша")
 
 
 class WaitAction(BaseModel):
-    action: str = Field("wait", description="Тип действия")
+    action: Literal["wait"] = Field(..., description="Тип действия")
     seconds: int = Field(..., description="Количество секунд ожидания")
 
 
-ActionType = Union[ClickAction, TypeAction, CommandAction, WaitAction]
+class WaitForTextAction(BaseModel):
+    action: Literal["wait_for_text"] = Field(..., description="Тип действия")
+    text: str = Field(..., description="Текст, который должен появиться на странице")
+    timeout: int = Field(10, description="Максимальное время ожидания в секундах")
+
+
+class WaitForElementAction(BaseModel):
+    action: Literal["wait_for_element"] = Field(..., description="Тип действия")
+    role: str = Field(..., description="ARIA-роль элемента: button, link, textbox, listbox, option, dialog и т.д.")
+    name: str = Field(..., description="Видимое имя элемента")
+    timeout: int = Field(10, description="Максимальное время ожидания в секундах")
+
+
+class WaitForUrlAction(BaseModel):
+    action: Literal["wait_for_url"] = Field(..., description="Тип действия")
+    url_contains: str = Field("", description="Часть нового URL; пусто - любая смена URL")
+    timeout: int = Field(10, description="Максимальное время ожидания в секундах")
+
+
+class WaitForNetworkIdleAction(BaseModel):
+    action: Literal["wait_for_network_idle"] = Field(..., description="Тип действия")
+    timeout: int = Field(10, description="Максимальное время ожидания в секундах")
+
+
+# Тип действия выбирается по полю action, а не по первой подошедшей по полям модели
+ActionType = Annotated[
+    Union[ClickAction, TypeAction, CommandAction, WaitForTextAction, WaitForElementAction, WaitForUrlAction, WaitForNetworkIdleAction, WaitAction],
+    Field(discriminator="action"),
+]
 
 
 class DecisionResponse(BaseModel):
@@ -38,3 +67,9 @@ class VerificationResult(BaseModel):
     success: bool = Field(..., description="Успешно ли достигнут результат")
     details: str = Field(..., description="Подробное описание того что видно на экране")
     summary: str = Field(..., description="Краткое резюме результата")
+
+
+class ClickRefinement(BaseModel):
+    found: bool = Field(..., description="Найден ли элемент на фрагменте")
+    x: int = Field(..., description="Координата X на фрагменте")
+    y: int = Field(..., description="Координата Y на фрагменте")
@@ -1,25 +1,50 @@
 import asyncio
 import base64
+import hashlib
+import io
 import time
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_openai import ChatOpenAI
-from PIL import Image, ImageDraw
-from pydantic import SecretStr
-
-from agent.models import DecisionResponse, ClickAction, TypeAction, CommandAction, WaitAction, VerificationResult
+from langgraph.runtime import Runtime
+
+from agent.llm_gateway import LLMGateway, get_gateway
+from agent.models import (
+    ClickAction,
+    ClickRefinement,
+    CommandAction,
+    DecisionResponse,
+    TypeAction,
+    VerificationResult,
+    WaitAction,
+    WaitForElementAction,
+    WaitForNetworkIdleAction,
+    WaitForTextAction,
+    WaitForUrlAction,
+)
+from agent.observation import ObservationPrefetch, discard_task
 from agent.prompt_loader import render_prompt
-from agent.state import AgentState
+from agent.state import AgentContext, AgentState
+from browser_controller.base import BaseBrowserController, is_batchable
+from utils.budget import BudgetExceeded, RunBudget
 from utils.config import CONFIG
-from utils.log import get_logger
+from utils.frame_diff import frame_diff
+from utils.log import get_logger, log_event
 
 logger = get_logger()
 
+_CLICK_REFINE_CACHE_SIZE = 64
+_click_refine_cache: "OrderedDict[Tuple[str, int, int, str], Tuple[int, int]]" = OrderedDict()
+
 
 @lru_cache(maxsize=None)
 def _get_base_llm():
+    # langchain_openai и клиент OpenAI тяжелые при импорте, поэтому грузятся при первом обращении к модели
+    from langchain_openai import ChatOpenAI
+    from pydantic import SecretStr
+
     api_key = SecretStr(CONFIG.gpt.token) if isinstance(CONFIG.gpt.token, str) else CONFIG.gpt.token
     return ChatOpenAI(base_url=CONFIG.gpt.url, api_key=api_key, model=CONFIG.gpt.model, temperature=0)
 
@@ -31,26 +56,42 @@ def get_llm(structured_output_class=None):
     return llm
 
 
-async def _retry_llm_call(llm, messages, max_retries: int = 3):
+def _get_browser(state: AgentState, runtime: Runtime[AgentContext]) -> BaseBrowserController:
+    return runtime.context.browser.get_page(state.get("page_name") or "main")
+
+
+async def _retry_llm_call(output_class, messages, max_retries: int = 3, budget: Optional[RunBudget] = None, name: str = "llm"):
+    # Все вызовы идут через общий шлюз: лимиты процесса, приоритет по дедлайну запуска и склейка одинаковых запросов
+    llm = get_llm(output_class)
+    gateway = get_gateway()
+    key = LLMGateway.request_key(output_class.__name__, messages)
     last_exception = None
     for attempt in range(max_retries):
+        if budget:
+            budget.count_llm_call()
+        start_time = time.time()
         try:
-            return await llm.ainvoke(messages)
+            response = await gateway.invoke(llm, messages, key=key, deadline=budget.active_deadline if budget else None, name=name)
+            log_event("llm_call", name=name, attempt=attempt + 1, success=True, duration=time.time() - start_time)
+            return response
         except Exception as e:
+            log_event("llm_call", name=name, attempt=attempt + 1, success=False, duration=time.time() - start_time, error=str(e))
             last_exception = e
-            logger.warning(f"LLM вызов не удался (попытка {attempt + 1}/{max_retries}): {e}")
+            logger.warning("LLM вызов не удался (попытка {}/{}): {}", attempt + 1, max_retries, e)
             if attempt == max_retries - 1:
                 raise last_exception
             await asyncio.sleep(2**attempt)
     raise last_exception
 
 
-def _draw_click_point_on_screenshot(screenshot_path: str, x: int, y: int, output_path: str = None) -> str:
+def _draw_click_point_on_screenshot(screenshot_path: str, x: int, y: int, output_path: str = None, frame: Optional[bytes] = None) -> str:
+    from PIL import Image, ImageDraw
+
     try:
         if output_path is None:
             output_path = screenshot_path.replace(".png", "_with_click.png")
 
-        with Image.open(screenshot_path) as img:
+        with Image.open(io.BytesIO(frame) if frame else screenshot_path) as img:
             draw = ImageDraw.Draw(img)
             radius = 8
             draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill="red", outline="darkred", width=2)
@@ -60,19 +101,123 @@ def _draw_click_point_on_screenshot(screenshot_path: str, x: int, y: int, output
             img.save(output_path)
             return output_path
     except Exception as e:
-        logger.error(f"Ошибка рисования точки клика: {e}")
+        logger.error("Ошибка рисования точки клика: {}", e)
         return screenshot_path
 
 
+def _crop_click_tile(frame: bytes, x: int, y: int, tile_size: int, scale: int) -> Tuple[str, int, int, int, int]:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(frame)) as img:
+        half = tile_size // 2
+        left = max(0, min(x - half, img.width - tile_size))
+        top = max(0, min(y - half, img.height - tile_size))
+        tile = img.crop((left, top, min(left + tile_size, img.width), min(top + tile_size, img.height)))
+        tile = tile.resize((tile.width * scale, tile.height * scale), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        tile.convert("RGB").save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode("utf-8"), left, top, tile.width, tile.height
+
+
+async def _refine_click_point(frame: bytes, frame_digest: str, x: int, y: int, element_desc: str, budget: Optional[RunBudget] = None) -> Tuple[int, int]:
+    cache_key = (frame_digest, x, y, element_desc)
+    if cache_key in _click_refine_cache:
+        _click_refine_cache.move_to_end(cache_key)
+        return _click_refine_cache[cache_key]
+
+    scale = CONFIG.click_zoom.scale
+    tile, left, top, width, height = _crop_click_tile(frame, x, y, CONFIG.click_zoom.tile_size, scale)
+    prompt = render_prompt("refine_click", element_description=element_desc, x=(x - left) * scale, y=(y - top) * scale, width=width, height=height)
+    messages = [
+        HumanMessage(
+            content=[
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{tile}"}},
+            ]
+        )
+    ]
+
+    response = await _retry_llm_call(ClickRefinement, messages, budget=budget, name="refine_click")
+    if response.found and 0 <= response.x < width and 0 <= response.y < height:
+        point = (left + response.x // scale, top + response.y // scale)
+    else:
+        point = (x, y)
+
+    _click_refine_cache[cache_key] = point
+    if len(_click_refine_cache) > _CLICK_REFINE_CACHE_SIZE:
+        _click_refine_cache.popitem(last=False)
+    return point
+
+
+_EFFECT_NOTES = {"noop": "без видимого эффекта", "diverged": "экран неожиданно сильно изменился"}
+
+
+def _classify_effect(action_name: str, changed: float, local: Optional[float]) -> Optional[str]:
+    if changed > CONFIG.effect.diverge_threshold:
+        return "diverged"
+    # Ввод нескольких символов или нажатие клавиши меняют слишком мало пикселей, чтобы надежно отличить их от холостого действия,
+    # поэтому холостым считается только клик, не изменивший ни весь кадр, ни область вокруг точки клика
+    if action_name == "click_element" and local is not None and max(changed, local) < CONFIG.effect.noop_threshold:
+        return "noop"
+    return None
+
+
+def _should_replan(state: AgentState, index: int, effect: Optional[str]) -> bool:
+    # Последнее действие плана и так ведет к новому решению
+    return effect is not None and index < len(state["action_queue"]) - 1
+
+
+def _abort_queue(state: AgentState) -> None:
+    logger.info("Экран разошелся с планом, пропускаем оставшиеся действия и возвращаемся к принятию решения")
+    state["history"].append("Оставшиеся действия плана пропущены: экран не соответствует ожиданиям")
+    # next_step сдвинет указатель за конец очереди, и граф вернется в decision_node
+    state["current_step"] = len(state["action_queue"]) - 1
+
+
+async def _detect_effect(
+    browser: BaseBrowserController, action_name: str, before: bytes, acted_at: float, point: Optional[Tuple[int, int]] = None
+) -> Tuple[Optional[str], bytes]:
+    # Кадр "после" должен быть снят позже начала действия, иначе в режиме скринкаста он совпадет с кадром "до".
+    # Он же возвращается вызывающему и служит кадром "до" для следующего действия пакета
+    after = await browser.capture_frame(settle=CONFIG.effect.settle_ms / 1000, since=acted_at)
+    changed = frame_diff(before, after)
+    local = frame_diff(before, after, around=point) if point else None
+    effect = _classify_effect(action_name, changed, local)
+    log_event("action_effect", action=action_name, changed=changed, local=local, effect=effect)
+    return effect, after
+
+
+async def _apply_action_effect(
+    state: AgentState, browser: BaseBrowserController, action_name: str, before: bytes, acted_at: float, point: Optional[Tuple[int, int]] = None
+) -> None:
+    effect, _ = await _detect_effect(browser, action_name, before, acted_at, point)
+    if effect:
+        state["history"][-1] += f" ({_EFFECT_NOTES[effect]})"
+    if _should_replan(state, state["current_step"], effect):
+        _abort_queue(state)
+
+
 def _convert_actions_to_queue(actions: List) -> List[Dict]:
     actions_list = []
     for action in actions:
         if isinstance(action, ClickAction):
-            action_dict = {"action": "click_element", "params": {"element_description": action.element_description, "x": action.x, "y": action.y}}
+            action_dict = {
+                "action": "click_element",
+                "params": {"element_description": action.element_description, "x": action.x, "y": action.y, "small": action.small},
+            }
         elif isinstance(action, TypeAction):
             action_dict = {"action": "type", "params": {"text": action.text}}
         elif isinstance(action, CommandAction):
             action_dict = {"action": "command", "params": {"command": action.command}}
+        elif isinstance(action, WaitForTextAction):
+            action_dict = {"action": "wait", "params": {"until": "text", "text": action.text, "timeout": action.timeout}}
+        elif isinstance(action, WaitForElementAction):
+            action_dict = {"action": "wait", "params": {"until": "element", "role": action.role, "name": action.name, "timeout": action.timeout}}
+        elif isinstance(action, WaitForUrlAction):
+            action_dict = {"action": "wait", "params": {"until": "url", "url_contains": action.url_contains, "timeout": action.timeout}}
+        elif isinstance(action, WaitForNetworkIdleAction):
+            action_dict = {"action": "wait", "params": {"until": "network_idle", "timeout": action.timeout}}
         elif isinstance(action, WaitAction):
             action_dict = {"action": "wait", "params": {"seconds": action.seconds}}
         else:
@@ -81,30 +226,70 @@ def _convert_actions_to_queue(actions: List) -> List[Dict]:
     return actions_list
 
 
-async def decision_maker(state: AgentState) -> AgentState:
-    if state.get("completed") or state.get("history"):
-        screenshot = await state["browser"].get_screenshot(save_to_disk=False)
-        with open(screenshot, "rb") as f:
-            state["screenshot"] = base64.b64encode(f.read()).decode("utf-8")
+async def _request_decision(state: AgentState, screenshot: str, budget: Optional[RunBudget], name: str = "decision") -> DecisionResponse:
+    system_prompt = render_prompt("decision_maker", original_task=state["task"], history=", ".join(state.get("history", [])))
+    messages = [
+        HumanMessage(
+            content=[
+                {"type": "text", "text": system_prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{screenshot}"}},
+            ]
+        )
+    ]
+    return await _retry_llm_call(DecisionResponse, messages, budget=budget, name=name)
+
+
+def _start_observation(state: AgentState, runtime: Runtime[AgentContext]) -> None:
+    page_name = state.get("page_name") or "main"
+    previous = runtime.context.observations.pop(page_name, None)
+    if previous:
+        previous.cancel()
+    runtime.context.observations[page_name] = ObservationPrefetch(
+        _get_browser(state, runtime),
+        quiet=CONFIG.observation.settle_quiet_ms / 1000,
+        timeout=CONFIG.observation.settle_timeout_ms / 1000,
+        threshold=CONFIG.effect.noop_threshold,
+    )
+
+
+async def _decide_on_prefetched(state: AgentState, observation: ObservationPrefetch, budget: Optional[RunBudget]) -> DecisionResponse:
+    if not CONFIG.observation.speculative:
+        state["screenshot"] = await observation.settled()
+        return await _request_decision(state, state["screenshot"], budget)
+
+    # Решение по предварительному кадру идет параллельно с ожиданием стабильного и выбрасывается, если экран еще менялся
+    provisional = await observation.provisional
+    speculative = asyncio.create_task(_request_decision(state, provisional, budget, name="decision_speculative"))
+    try:
+        state["screenshot"] = await observation.settled()
+        if not observation.changed:
+            log_event("speculative_decision", used=True)
+            return await speculative
+    except BaseException:
+        discard_task(speculative)
+        raise
 
-    llm = get_llm(DecisionResponse)
+    discard_task(speculative)
+    log_event("speculative_decision", used=False)
+    return await _request_decision(state, state["screenshot"], budget)
 
-    system_prompt = render_prompt("decision_maker", original_task=state["task"], history=", ".join(state.get("history", [])))
 
-    logger.info(f"Отправляем запрос на принятие решения: {state['task']}")
+async def decision_maker(state: AgentState, runtime: Runtime[AgentContext]) -> AgentState:
+    observation = runtime.context.observations.pop(state.get("page_name") or "main", None)
+    if not observation and (state.get("completed") or state.get("history")):
+        screenshot = await _get_browser(state, runtime).get_screenshot(save_to_disk=False)
+        with open(screenshot, "rb") as f:
+            state["screenshot"] = base64.b64encode(f.read()).decode("utf-8")
+
+    logger.info("Отправляем запрос на принятие решения: {}", state["task"])
 
     try:
-        messages = [
-            HumanMessage(
-                content=[
-                    {"type": "text", "text": system_prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{state['screenshot']}"}},
-                ]
-            )
-        ]
-
-        response = await _retry_llm_call(llm, messages)
-        logger.info(f"Ответ модели: {response}")
+        if observation:
+            response = await _decide_on_prefetched(state, observation, runtime.context.budget)
+        else:
+            response = await _request_decision(state, state["screenshot"], runtime.context.budget)
+        logger.debug("Ответ модели: {}", response)
+        log_event("decision", status=response.status, actions=len(response.actions), reason=response.reason)
 
         if response.status == "success":
             state["goal_achieved"] = True
@@ -113,7 +298,7 @@ async def decision_maker(state: AgentState) -> AgentState:
         elif response.status == "failed":
             state["goal_failed"] = True
             state["error"] = response.reason or "Невозможно достичь цели"
-            logger.error(f"Цель не может быть достигнута: {response.reason}")
+            logger.error("Цель не может быть достигнута: {}", response.reason)
         else:
             if response.actions:
                 state["action_queue"] = _convert_actions_to_queue(response.actions)
@@ -121,7 +306,7 @@ async def decision_maker(state: AgentState) -> AgentState:
                 state["completed"] = False
                 state["goal_achieved"] = None
                 state["goal_failed"] = None
-                logger.info(f"План создан: {len(state['action_queue'])} действий")
+                logger.info("План создан: {} действий", len(state["action_queue"]))
             else:
                 state["goal_failed"] = True
                 state["error"] = "Не удалось создать план действий"
@@ -134,13 +319,13 @@ async def decision_maker(state: AgentState) -> AgentState:
         if not state.get("messages"):
             state["messages"] = []
         state["messages"].append(AIMessage(content=f"Ошибка structured output: {e}"))
-        logger.error(f"Ошибка structured output: {e}")
+        logger.error("Ошибка structured output: {}", e)
         raise
 
     return state
 
 
-async def execute_click(state: AgentState) -> AgentState:
+async def execute_click(state: AgentState, runtime: Runtime[AgentContext]) -> AgentState:
     try:
         action = state["action_queue"][state["current_step"]]
         params = action["params"]
@@ -150,13 +335,34 @@ async def execute_click(state: AgentState) -> AgentState:
             return state
 
         x, y = int(params["x"]), int(params["y"])
-        screenshot_before = await state["browser"].get_screenshot(save_to_disk=False)
+        screenshot_before = await _get_browser(state, runtime).get_screenshot(save_to_disk=False)
+        # Временный файл скриншота общий для страниц, запущенных параллельно: читаем его один раз до следующего await
+        with open(screenshot_before, "rb") as f:
+            frame_before = f.read()
         element_desc = params.get("element_description", f"координаты ({x}, {y})")
 
+        # Уточняем точку по увеличенному фрагменту, только если цель мелкая или прошлый клик не изменил экран
+        frame_digest = hashlib.md5(frame_before).hexdigest()
+        page_name = state.get("page_name") or "main"
+        previous_frame = runtime.context.click_frames.get(page_name)
+        # Сравниваем по доле изменившихся пикселей: мигающий курсор или анимация не должны считаться эффектом клика
+        repeated = previous_frame is not None and frame_diff(previous_frame, frame_before) < CONFIG.effect.noop_threshold
+        if CONFIG.click_zoom.enabled and (params.get("small") or repeated):
+            try:
+                refined_x, refined_y = await _refine_click_point(frame_before, frame_digest, x, y, element_desc, runtime.context.budget)
+                if (refined_x, refined_y) != (x, y):
+                    logger.info("Точка клика уточнена: ({}, {}) -> ({}, {})", x, y, refined_x, refined_y)
+                    x, y = refined_x, refined_y
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                logger.warning("Не удалось уточнить точку клика: {}", e)
+        runtime.context.click_frames[page_name] = frame_before
+
         if CONFIG.debug:
             click_screenshot_path = f"{CONFIG.output_dir}/click_{int(time.time())}_{x}_{y}.png"
-            screenshot_with_click = _draw_click_point_on_screenshot(screenshot_before, x, y, click_screenshot_path)
-            logger.info(f"Клик по координатам ({x}, {y}) - скриншот с точкой: {screenshot_with_click}")
+            screenshot_with_click = _draw_click_point_on_screenshot(screenshot_before, x, y, click_screenshot_path, frame=frame_before)
+            logger.info("Клик по координатам ({}, {}) - скриншот с точкой: {}", x, y, screenshot_with_click)
             if not state.get("history"):
                 state["history"] = []
             state["history"].append(f"Клик по {element_desc} ({x}, {y}) - скриншот: {screenshot_with_click}")
@@ -165,29 +371,42 @@ async def execute_click(state: AgentState) -> AgentState:
                 state["history"] = []
             state["history"].append(f"Клик по {element_desc} ({x}, {y})")
 
-        await state["browser"].click_by_position(x, y)
+        acted_at = time.time()
+        await _get_browser(state, runtime).click_by_position(x, y)
+        log_event("action", action="click_element", x=x, y=y, element=element_desc)
+
+        if CONFIG.effect.enabled:
+            await _apply_action_effect(state, _get_browser(state, runtime), "click_element", frame_before, acted_at, (x, y))
 
         if not state.get("messages"):
             state["messages"] = []
         state["messages"].append(AIMessage(content=f"Выполнен клик по {element_desc}"))
 
+    except BudgetExceeded:
+        raise
     except Exception as e:
         state["error"] = f"Ошибка клика: {str(e)}"
 
     return state
 
 
-async def execute_type(state: AgentState) -> AgentState:
+async def execute_type(state: AgentState, runtime: Runtime[AgentContext]) -> AgentState:
     try:
         action = state["action_queue"][state["current_step"]]
         params = action["params"]
 
-        await state["browser"].type_text(params["text"])
+        before = await _get_browser(state, runtime).capture_frame() if CONFIG.effect.enabled else None
+        acted_at = time.time()
+        await _get_browser(state, runtime).type_text(params["text"])
+        log_event("action", action="type", length=len(params["text"]))
 
         if not state.get("history"):
             state["history"] = []
         state["history"].append(f"Введен текст: {params['text']}")
 
+        if before is not None:
+            await _apply_action_effect(state, _get_browser(state, runtime), "type", before, acted_at)
+
         if not state.get("messages"):
             state["messages"] = []
         state["messages"].append(AIMessage(content=f"Введен текст: {params['text']}"))
@@ -198,17 +417,23 @@ async def execute_type(state: AgentState) -> AgentState:
     return state
 
 
-async def execute_command(state: AgentState) -> AgentState:
+async def execute_command(state: AgentState, runtime: Runtime[AgentContext]) -> AgentState:
     try:
         action = state["action_queue"][state["current_step"]]
         params = action["params"]
 
-        await state["browser"].execute_command(params["command"])
+        before = await _get_browser(state, runtime).capture_frame() if CONFIG.effect.enabled else None
+        acted_at = time.time()
+        await _get_browser(state, runtime).execute_command(params["command"])
+        log_event("action", action="command", command=params["command"])
 
         if not state.get("history"):
             state["history"] = []
         state["history"].append(f"Выполнена команда: {params['command']}")
 
+        if before is not None:
+            await _apply_action_effect(state, _get_browser(state, runtime), "command", before, acted_at)
+
         if not state.get("messages"):
             state["messages"] = []
         state["messages"].append(AIMessage(content=f"Выполнена команда: {params['command']}"))
@@ -219,26 +444,57 @@ async def execute_command(state: AgentState) -> AgentState:
     return state
 
 
-async def execute_wait(state: AgentState) -> AgentState:
+async def _wait_for_condition(browser: BaseBrowserController, params: Dict) -> str:
+    until = params["until"]
+    timeout = float(params.get("timeout", 10))
+    start_time = time.time()
+
+    if until == "text":
+        description = f"появления текста '{params['text']}'"
+        met = await browser.wait_for_text(params["text"], timeout)
+    elif until == "element":
+        description = f"появления элемента {params['role']} '{params['name']}'"
+        met = await browser.wait_for_element(params["role"], params["name"], timeout)
+    elif until == "url":
+        description = f"смены URL на '{params['url_contains']}'" if params.get("url_contains") else "смены URL"
+        met = await browser.wait_for_url(params.get("url_contains", ""), timeout)
+    elif until == "network_idle":
+        description = "загрузки страницы"
+        met = await browser.wait_for_network_idle(timeout)
+    else:
+        raise ValueError(f"Неизвестное условие ожидания: {until}")
+
+    if met:
+        return f"Ожидание {description}: выполнено за {time.time() - start_time:.1f}с"
+    return f"Ожидание {description}: не дождались за {timeout:.0f}с"
+
+
+async def execute_wait(state: AgentState, runtime: Runtime[AgentContext]) -> AgentState:
     try:
         action = state["action_queue"][state["current_step"]]
         params = action["params"]
-        seconds = int(params.get("seconds", 3))
 
-        logger.info(f"Ожидание {seconds} секунд...")
-        await asyncio.sleep(seconds)
+        if params.get("until"):
+            result = await _wait_for_condition(_get_browser(state, runtime), params)
+            logger.info(result)
+        else:
+            seconds = int(params.get("seconds", 3))
+            logger.info("Ожидание {} секунд...", seconds)
+            await asyncio.sleep(seconds)
+            result = f"Ожидание {seconds} секунд"
+        log_event("action", action="wait", until=params.get("until"), result=result)
 
-        screenshot = await state["browser"].get_screenshot(save_to_disk=False)
+        screenshot = await _get_browser(state, runtime).get_screenshot(save_to_disk=False)
         with open(screenshot, "rb") as f:
             state["screenshot"] = base64.b64encode(f.read()).decode("utf-8")
 
         if not state.get("history"):
             state["history"] = []
-        state["history"].append(f"Ожидание {seconds} секунд")
+        state["history"].append(result)
 
         if not state.get("messages"):
             state["messages"] = []
-        state["messages"].append(AIMessage(content=f"Ожидание {seconds} секунд завершено"))
+        state["messages"].append(AIMessage(content=f"{result} завершено" if not params.get("until") else result))
 
     except Exception as e:
         state["error"] = f"Ошибка ожидания: {str(e)}"
@@ -246,13 +502,97 @@ async def execute_wait(state: AgentState) -> AgentState:
     return state
 
 
-def next_step(state: AgentState) -> AgentState:
+def _batchable_run(state: AgentState) -> List[Dict]:
+    run = []
+    for action in state["action_queue"][state["current_step"] :]:
+        if not is_batchable(action):
+            break
+        # Мелкие цели уточняются по одной в execute_click, в пакет их не берем
+        if CONFIG.click_zoom.enabled and action["params"].get("small"):
+            break
+        run.append(action)
+    return run
+
+
+def _describe_action(action: Dict) -> str:
+    params = action["params"]
+    if action["action"] == "click_element":
+        return f"Клик по {params.get('element_description', 'координатам')} ({params['x']}, {params['y']})"
+    if action["action"] == "type":
+        return f"Введен текст: {params['text']}"
+    return f"Выполнена команда: {params['command']}"
+
+
+async def execute_batch(state: AgentState, runtime: Runtime[AgentContext]) -> AgentState:
+    actions = _batchable_run(state)
+    budget = runtime.context.budget
+    # Первое действие пакета уже учтено в next_step; остальные - только в пределах лимита, следующее за ним остановит next_step
+    remaining = budget.remaining_actions() if budget else None
+    if remaining is not None:
+        actions = actions[: 1 + remaining]
+
+    try:
+        logger.info("Пакетное выполнение {} действий", len(actions))
+        browser = _get_browser(state, runtime)
+        start = state["current_step"]
+        effects: Dict[int, Optional[str]] = {}
+        replan = False
+        after_action = None
+
+        if CONFIG.effect.enabled:
+            before = await browser.capture_frame()
+            # Действие пакета начинается сразу после снимка предыдущего кадра
+            acted_at = time.time()
+
+            async def after_action(index: int, action: Dict) -> bool:
+                nonlocal replan, before, acted_at
+                point = (int(action["params"]["x"]), int(action["params"]["y"])) if action["action"] == "click_element" else None
+                effects[index], before = await _detect_effect(browser, action["action"], before, acted_at, point)
+                acted_at = time.time()
+                replan = _should_replan(state, start + index, effects[index])
+                return not replan
+
+        executed = await browser.execute_batch(actions, after_action)
+        if budget:
+            budget.count_action(executed - 1)
+        log_event("action", action="batch", actions=[action["action"] for action in actions[:executed]])
+
+        if not state.get("history"):
+            state["history"] = []
+        for index, action in enumerate(actions[:executed]):
+            note = _EFFECT_NOTES.get(effects.get(index))
+            state["history"].append(f"{_describe_action(action)} ({note})" if note else _describe_action(action))
+
+        if not state.get("messages"):
+            state["messages"] = []
+        state["messages"].append(AIMessage(content=f"Выполнено действий пакетом: {executed}"))
+
+        if replan:
+            _abort_queue(state)
+        else:
+            # next_step сдвинет указатель на действие после пакета
+            state["current_step"] += executed - 1
+
+    except BudgetExceeded:
+        raise
+    except Exception as e:
+        state["error"] = f"Ошибка пакетного выполнения: {str(e)}"
+
+    return state
+
+
+async def next_step(state: AgentState, runtime: Runtime[AgentContext]) -> AgentState:
     state["current_step"] += 1
-    logger.info(f"Переход к шагу {state['current_step'] + 1} из {len(state['action_queue'])}")
+    logger.info("Переход к шагу {} из {}", state["current_step"] + 1, len(state["action_queue"]))
 
     if state["current_step"] >= len(state["action_queue"]):
         logger.info("Все действия выполнены, переходим к проверке цели")
         state["completed"] = True
+        if CONFIG.observation.prefetch and not state.get("error"):
+            # Кадр для следующего решения снимается и кодируется, пока страница еще успокаивается
+            _start_observation(state, runtime)
+    elif runtime.context.budget:
+        runtime.context.budget.count_action()
 
     return state
 
@@ -269,28 +609,34 @@ async def fail_node(state: AgentState) -> AgentState:
     return state
 
 
-async def verify_final_result(screenshot: str, expected_result: str, all_history: list) -> dict:
-    llm = get_llm(VerificationResult)
-
-    system_prompt = render_prompt("verify_final_result", expected_result=expected_result, all_history=", ".join(all_history))
+async def verify_final_result(
+    screenshot: str, expected_result: str, all_history: list, budget: Optional[RunBudget] = None, page_screenshots: Optional[Dict[int, str]] = None
+) -> dict:
+    page_screenshots = page_screenshots or {}
+    system_prompt = render_prompt(
+        "verify_final_result", expected_result=expected_result, all_history=", ".join(all_history), parallel_steps=sorted(page_screenshots)
+    )
 
     logger.info("Проверяем финальный результат")
 
     try:
-        messages = [
-            HumanMessage(
-                content=[
-                    {"type": "text", "text": system_prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{screenshot}"}},
-                ]
-            )
+        content = [
+            {"type": "text", "text": system_prompt},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{screenshot}"}},
         ]
-
-        response = await _retry_llm_call(llm, messages)
-        logger.info(f"Ответ на проверку результата: {response}")
+        for step_num, page_screenshot in sorted(page_screenshots.items()):
+            content.append({"type": "text", "text": f"Step {step_num} page:"})
+            content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{page_screenshot}"}})
+        messages = [HumanMessage(content=content)]
+
+        response = await _retry_llm_call(VerificationResult, messages, budget=budget, name="verify")
+        logger.debug("Ответ на проверку результата: {}", response)
+        log_event("verification", success=response.success, summary=response.summary)
         return {"success": response.success, "details": response.details, "summary": response.summary}
+    except BudgetExceeded:
+        raise
     except Exception as e:
-        logger.error(f"Ошибка проверки результата: {e}")
+        logger.error("Ошибка проверки результата: {}", e)
         return {"success": False, "details": "Ошибка анализа результата", "summary": "Не удалось проанализировать результат"}
 
 
@@ -305,5 +651,8 @@ def should_continue(state: AgentState) -> str:
     if state["current_step"] >= len(state["action_queue"]):
         return "decision_node"
 
+    if CONFIG.input.batch_actions and len(_batchable_run(state)) > 1:
+        return "batch_node"
+
     current_action = state["action_queue"][state["current_step"]]["action"]
     return f"{current_action}_node"
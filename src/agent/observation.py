@@ -0,0 +1,63 @@
+import asyncio
+import base64
+import time
+
+from browser_controller.base import BaseBrowserController
+from utils.frame_diff import frame_diff
+from utils.log import get_logger
+
+logger = get_logger()
+
+
+class ObservationPrefetch:
+    """Кадр для следующего решения, который снимается и кодируется параллельно с ожиданием успокоения страницы."""
+
+    def __init__(self, browser: BaseBrowserController, quiet: float, timeout: float, threshold: float):
+        self.browser = browser
+        self.quiet = quiet
+        self.timeout = timeout
+        self.threshold = threshold
+        # Первый снятый кадр: по нему можно начать решение, не дожидаясь стабильного
+        self.provisional: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.changed = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> str:
+        started = time.time()
+        try:
+            frame = await self.browser.capture_frame()
+        except Exception as e:
+            # Ожидающий provisional не должен зависнуть, если снимок не удался
+            self.provisional.set_exception(e)
+            self.provisional.exception()
+            raise
+        encoded = base64.b64encode(frame).decode("utf-8")
+        self.provisional.set_result(encoded)
+
+        # Кадр стабилен, когда за интервал тишины он не изменился заметно
+        while time.time() - started < self.timeout:
+            await asyncio.sleep(self.quiet)
+            # Стабильным может считаться только кадр, снятый после действия: старый кадр скринкаста заменяется новым снимком
+            current = await self.browser.capture_frame(since=started)
+            if frame_diff(frame, current) < self.threshold:
+                return encoded
+            self.changed = True
+            frame = current
+            encoded = base64.b64encode(frame).decode("utf-8")
+
+        logger.debug("Экран не успокоился за {}с, берем последний кадр", self.timeout)
+        return encoded
+
+    async def settled(self) -> str:
+        return await self._task
+
+    def cancel(self) -> None:
+        discard_task(self._task)
+        if not self.provisional.done():
+            self.provisional.cancel()
+
+
+def discard_task(task: asyncio.Task) -> None:
+    task.cancel()
+    # Результат отброшенной задачи не нужен, но ее ошибка не должна всплыть как "Task exception was never retrieved"
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
@@ -1,13 +1,16 @@
-from typing import List, Optional, TypedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, TypedDict
 
 from langchain_core.messages import BaseMessage
 
+from agent.observation import ObservationPrefetch
 from browser_controller.base import BaseBrowserController
+from utils.budget import RunBudget
 
 
 class AgentState(TypedDict):
     task: str
-    browser: "BaseBrowserController"
+    page_name: str
     screenshot: Optional[str]
     messages: List[BaseMessage]
     action_queue: list
@@ -17,3 +20,14 @@ class AgentState(TypedDict):
     history: List[str]
     goal_achieved: Optional[bool]
     goal_failed: Optional[bool]
+
+
+@dataclass
+class AgentContext:
+    # Не сериализуется чекпоинтером, поэтому живёт в runtime-контексте, а не в AgentState
+    browser: BaseBrowserController
+    budget: Optional[RunBudget] = None
+    # Подготовленные в next_step кадры для следующего решения, по имени страницы
+    observations: Dict[str, ObservationPrefetch] = field(default_factory=dict)
+    # Кадр перед последним кликом по имени страницы: если следующий клик видит тот же экран, точку стоит уточнить
+    click_frames: Dict[str, bytes] = field(default_factory=dict)
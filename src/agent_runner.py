@@ -1,15 +1,23 @@
 import asyncio
 import base64
 import time
-from typing import Dict, Tuple
+import uuid
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+
+from langgraph.checkpoint.memory import InMemorySaver
 
 from agent.graph import create_agent_graph
 from agent.nodes import verify_final_result
-from agent.state import AgentState
+from agent.state import AgentContext, AgentState
 from browser_controller.playwright_controller import PlaywrightController
+from browser_controller.storage_state import StorageStateStore
+from utils.budget import BudgetExceeded, RunBudget
+from utils.checkpoint import RunCheckpoint, RunProgress
 from utils.config import CONFIG
 from utils.execution_tracker import ExecutionMetrics, create_step_result
-from utils.log import get_logger
+from utils.log import get_logger, log_event
+from utils.result_stream import ResultStream
 
 log = get_logger()
 
@@ -24,21 +32,51 @@ def encode_image(image_path: str) -> str:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
 
-async def setup_browser(task_data) -> PlaywrightController:
-    browser = PlaywrightController(headless=CONFIG.playwright_headless)
-    await browser.start()
-    await browser.navigate_to(task_data.url)
+def split_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+async def setup_browser(task_data, progress: Optional[RunProgress] = None, storage_state: Optional[Dict] = None) -> PlaywrightController:
+    browser = PlaywrightController(
+        headless=CONFIG.playwright_headless,
+        block_resource_types=split_list(CONFIG.network.block_resource_types),
+        block_domains=split_list(CONFIG.network.block_domains),
+        har_mode=CONFIG.network.har_mode,
+        har_path=CONFIG.network.har_path,
+        fast_input=CONFIG.input.fast,
+        slow_input_domains=split_list(CONFIG.input.slow_domains),
+        observation_backend=CONFIG.observation.backend,
+        settle_quiet=CONFIG.observation.settle_quiet_ms / 1000,
+        screencast_quality=CONFIG.observation.screencast_quality,
+    )
+    if progress and progress.completed_steps:
+        await browser.start(storage_state=progress.storage_state_path)
+        await browser.navigate_to(progress.url or task_data.url)
+    else:
+        await browser.start(storage_state=storage_state)
+        await browser.navigate_to(task_data.url)
     return browser
 
 
-async def execute_step(browser: PlaywrightController, graph, task: str, step_num: int, total_steps: int, metrics: ExecutionMetrics) -> bool:
+async def execute_step(
+    browser: PlaywrightController,
+    graph,
+    task: str,
+    step_num: int,
+    total_steps: int,
+    metrics: ExecutionMetrics,
+    thread_id: Optional[str] = None,
+    budget: Optional[RunBudget] = None,
+) -> bool:
     start_time = time.time()
-    log.info(f"Выполняем шаг {step_num}/{total_steps}: {task}")
+    log.info("Выполняем шаг {}/{}: {}", step_num, total_steps, task)
+    log_event("step_start", step=step_num, page=browser.page_name, task=task)
 
     screenshot_before = await take_screenshot(browser, step_num, "step_before")
 
     initial_state = AgentState(
         task=task,
+        page_name=browser.page_name,
         screenshot=encode_image(screenshot_before),
         messages=[],
         action_queue=[],
@@ -46,59 +84,207 @@ async def execute_step(browser: PlaywrightController, graph, task: str, step_num
         completed=False,
         error=None,
         history=[],
-        browser=browser,
         goal_achieved=None,
         goal_failed=None,
     )
+    config = {"recursion_limit": 100}
+    if thread_id:
+        config["configurable"] = {"thread_id": thread_id}
+    budget = budget or RunBudget()
+    context = AgentContext(browser=browser, budget=budget)
+    result = initial_state
+    stop_reason = None
 
-    result = await graph.ainvoke(initial_state, {"recursion_limit": 100})
+    try:
+        # События узлов графа получают номер шага и страницу из контекста
+        with log.contextualize(step=step_num, page=browser.page_name):
+            async with budget.scope():
+                try:
+                    result = await graph.ainvoke(initial_state, config, context=context)
+                except BudgetExceeded:
+                    raise
+                except Exception as e:
+                    if not thread_id:
+                        raise
+                    # Продолжаем граф с последнего сохраненного узла, а не с начала шага
+                    log.warning("Шаг {} прерван ({}), продолжаем с последнего чекпоинта", step_num, e)
+                    result = await graph.ainvoke(None, config, context=context)
+    except BudgetExceeded as e:
+        stop_reason = e.reason
+        log.error("Шаг {} остановлен: {}", step_num, e.reason)
+        if thread_id:
+            result = (await graph.aget_state(config)).values or initial_state
+    finally:
+        # Кадры, подготовленные для решения, которое уже не состоится (дедлайн, ошибка), не должны сниматься дальше
+        for observation in context.observations.values():
+            observation.cancel()
+        context.observations.clear()
     await take_screenshot(browser, step_num, "step_after")
 
     execution_time = time.time() - start_time
-    step_result = create_step_result(step_num, total_steps, task, result, execution_time)
+    step_result = create_step_result(step_num, total_steps, task, result, execution_time, stop_reason)
     metrics.add_step(step_result)
+    log_event("step_end", step=step_num, page=browser.page_name, success=step_result.success, duration=execution_time, stop_reason=stop_reason)
 
-    if result.get("error"):
-        log.error(f"Прерывание выполнения на шаге {step_num}")
+    if stop_reason or result.get("error"):
+        log.error("Прерывание выполнения на шаге {}", step_num)
         return False
 
-    log.info(f"Шаг {step_num} завершен за {execution_time:.1f}с")
+    log.info("Шаг {} завершен за {:.1f}с", step_num, execution_time)
     return True
 
-async def verify_final_result_step(browser: PlaywrightController, task_data, metrics: ExecutionMetrics) -> Dict:
+
+async def execute_parallel_steps(
+    browser: PlaywrightController,
+    graph,
+    task_data,
+    step_nums: List[int],
+    metrics: ExecutionMetrics,
+    checkpoint: Optional[RunCheckpoint] = None,
+    budget: Optional[RunBudget] = None,
+) -> Tuple[bool, Dict[int, str]]:
+    log.info("Выполняем параллельно шаги {}", ", ".join(map(str, step_nums)))
+    total_steps = len(task_data.tasks)
+    start_time = time.time()
+    pages = []
+    # Итоговые кадры страниц шагов: страницы закрываются, а финальная проверка должна видеть их состояние
+    final_frames: Dict[int, str] = {}
+
+    try:
+        for step_num in step_nums:
+            pages.append(await browser.open_page(f"step_{step_num}", task_data.url))
+
+        steps = []
+        for page, step_num in zip(pages, step_nums, strict=True):
+            thread_id = checkpoint.thread_id(step_num) if checkpoint else None
+            steps.append(execute_step(page, graph, task_data.tasks[step_num - 1], step_num, total_steps, metrics, thread_id, budget))
+        # Дожидаемся всех шагов, даже если один упал: иначе страницы закроются под еще работающими шагами
+        results = await asyncio.gather(*steps, return_exceptions=True)
+
+        for page, step_num in zip(pages, step_nums, strict=True):
+            try:
+                final_frames[step_num] = encode_image(await take_screenshot(page, step_num, "parallel_final"))
+            except Exception as e:
+                log.warning("Не удалось снять итоговый экран шага {}: {}", step_num, e)
+    finally:
+        for page in pages:
+            await page.close()
+
+    for i, (step_num, result) in enumerate(zip(step_nums, results, strict=True)):
+        if isinstance(result, BaseException):
+            log.error("Шаг {} завершился с ошибкой: {}", step_num, result)
+            task = task_data.tasks[step_num - 1]
+            metrics.add_step(create_step_result(step_num, total_steps, task, {"error": f"Ошибка шага: {result}"}, time.time() - start_time))
+            results[i] = False
+
+    # Шаги завершаются в произвольном порядке, а история и чекпоинт опираются на порядок шагов
+    metrics.steps.sort(key=lambda step: step.step_num)
+    return all(results), final_frames
+
+
+async def verify_final_result_step(
+    browser: PlaywrightController, task_data, metrics: ExecutionMetrics, budget: Optional[RunBudget] = None, page_frames: Optional[Dict[int, str]] = None
+) -> Dict:
     log.info("Проверяем финальный результат...")
 
-    final_screenshot = await take_screenshot(browser, 0, "final_result")
-    final_screenshot_b64 = encode_image(final_screenshot)
+    budget = budget or RunBudget()
+    async with budget.scope(with_step=False):
+        final_screenshot = await take_screenshot(browser, 0, "final_result")
+        final_screenshot_b64 = encode_image(final_screenshot)
+
+        return await verify_final_result(
+            screenshot=final_screenshot_b64, expected_result=task_data.result, all_history=metrics.get_history(), budget=budget, page_screenshots=page_frames
+        )
+
+
+async def save_step_checkpoint(browser: PlaywrightController, checkpoint: RunCheckpoint, metrics: ExecutionMetrics, step_num: int) -> None:
+    try:
+        storage_state_path = await browser.save_storage_state(checkpoint.storage_state_path(step_num))
+        checkpoint.save(RunProgress(steps=list(metrics.steps), url=browser.get_url(), storage_state_path=storage_state_path))
+    except Exception as e:
+        log.warning("Не удалось сохранить чекпоинт шага {}: {}", step_num, e)
 
-    return await verify_final_result(screenshot=final_screenshot_b64, expected_result=task_data.result, all_history=metrics.get_history())
 
 async def run_all_tasks(task_data) -> Tuple[ExecutionMetrics, Dict]:
-    metrics = ExecutionMetrics()
-    graph = create_agent_graph()
-    browser = await setup_browser(task_data)
+    run_id = uuid.uuid4().hex[:12]
+    with log.contextualize(run_id=run_id, scenario_id=task_data.scenario_id):
+        log_event("run_start", url=task_data.url, steps=len(task_data.tasks))
+        stream = ResultStream.open(CONFIG.output_dir, run_id, task_data.scenario_id)
+        stream.write_run(task_data.url, len(task_data.tasks))
+
+        metrics, verification = await _run_all_tasks(task_data, ExecutionMetrics(on_step=stream.write_step))
+        metrics.finish()
+
+        stream.write_verification(verification)
+        stream.write_summary(metrics, verification)
+        log_event("run_end", success=verification["success"], duration=metrics.total_time)
+        return metrics, verification
+
+
+async def _run_all_tasks(task_data, metrics: ExecutionMetrics) -> Tuple[ExecutionMetrics, Dict]:
+    budget = RunBudget.from_config(CONFIG.budget)
+    checkpoint = RunCheckpoint.for_task(task_data, CONFIG.checkpoint.dir) if CONFIG.checkpoint.enabled else None
+    progress = RunProgress()
+    if checkpoint:
+        if CONFIG.checkpoint.resume:
+            progress = checkpoint.load()
+        else:
+            checkpoint.clear()
+
+    if progress.completed_steps:
+        log.info("Возобновляем запуск {} после шага {}", checkpoint.run_id, progress.completed_steps)
+        for step in progress.steps:
+            metrics.add_step(replace(step, resumed=True))
+
+    storage_store = StorageStateStore(CONFIG.storage_state.dir, CONFIG.storage_state.ttl) if CONFIG.storage_state.enabled else None
+    storage_key = StorageStateStore.resolve_key(task_data.url, task_data.session) if storage_store else None
+
+    graph = create_agent_graph(InMemorySaver() if checkpoint else None)
+    browser = await setup_browser(task_data, progress, storage_store.load(storage_key) if storage_key else None)
     verification = {"success": False, "details": "Выполнение не завершено", "summary": "Ошибка выполнения"}
 
+    # Кадры страниц последней параллельной группы: если сценарий ими заканчивается, результат виден только на них
+    parallel_frames: Dict[int, str] = {}
+
     try:
-        for i, task in enumerate(task_data.tasks, 1):
-            success = await execute_step(browser, graph, task, i, len(task_data.tasks), metrics)
+        for group in task_data.step_groups():
+            if group[-1] <= progress.completed_steps:
+                continue
+
+            if len(group) > 1:
+                success, parallel_frames = await execute_parallel_steps(browser, graph, task_data, group, metrics, checkpoint, budget)
+            else:
+                parallel_frames = {}
+                i = group[0]
+                thread_id = checkpoint.thread_id(i) if checkpoint else None
+                success = await execute_step(browser, graph, task_data.tasks[i - 1], i, len(task_data.tasks), metrics, thread_id, budget)
 
             if not success:
                 return metrics, verification
 
+            if checkpoint:
+                await save_step_checkpoint(browser, checkpoint, metrics, group[-1])
+
             await asyncio.sleep(1)
 
-        verification = await verify_final_result_step(browser, task_data, metrics)
+        verification = await verify_final_result_step(browser, task_data, metrics, budget, parallel_frames)
+
+        if checkpoint:
+            checkpoint.clear()
 
     except Exception as e:
-        log.error(f"Критическая ошибка: {e}")
+        log.error("Критическая ошибка: {}", e)
         verification = {"success": False, "details": str(e), "summary": f"Критическая ошибка: {e}"}
     finally:
+        # Сохраняем состояние только если сайт хоть раз отработал шаг, иначе рискуем закешировать капчу или ошибку
+        if storage_key and any(step.success for step in metrics.steps):
+            try:
+                await storage_store.save(browser, storage_key)
+            except Exception as e:
+                log.warning("Не удалось сохранить состояние браузера: {}", e)
         try:
             await browser.close()
         except Exception as e:
-            log.error(f"Ошибка закрытия браузера: {e}")
+            log.error("Ошибка закрытия браузера: {}", e)
 
     return metrics, verification
-
-
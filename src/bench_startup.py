@@ -0,0 +1,38 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+MAIN = str(Path(__file__).with_name("main.py"))
+
+
+def measure(command: List[str], runs: int) -> List[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время старта CLI агента")
+    parser.add_argument("task_file", help="файл задач для команды validate")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    scenarios = {
+        "python -c pass": [sys.executable, "-c", "pass"],
+        "main.py --help": [sys.executable, MAIN, "--help"],
+        "main.py validate": [sys.executable, MAIN, "validate", args.task_file],
+    }
+    for name, command in scenarios.items():
+        timings = measure(command, args.runs)
+        print(f"{name:<20} median {statistics.median(timings):7.1f} ms   min {min(timings):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
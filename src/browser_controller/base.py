@@ -1,5 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional
+
+BATCHABLE_ACTIONS = ("click_element", "type", "command")
+
+
+def is_batchable(action: Dict) -> bool:
+    params = action.get("params") or {}
+    if action.get("action") == "click_element":
+        return isinstance(params.get("x"), int) and isinstance(params.get("y"), int)
+    if action.get("action") == "type":
+        return isinstance(params.get("text"), str)
+    if action.get("action") == "command":
+        return bool(params.get("command"))
+    return False
 
 
 class BaseBrowserController(ABC):
@@ -22,3 +35,47 @@ class BaseBrowserController(ABC):
     @abstractmethod
     async def get_screenshot(self, path: Optional[str] = None, full_page: bool = True, save_to_disk: bool = True) -> str:
         pass
+
+    @abstractmethod
+    async def wait_for_text(self, text: str, timeout: float) -> bool:
+        pass
+
+    @abstractmethod
+    async def wait_for_element(self, role: str, name: str, timeout: float) -> bool:
+        pass
+
+    @abstractmethod
+    async def wait_for_url(self, url_contains: str, timeout: float) -> bool:
+        pass
+
+    @abstractmethod
+    async def wait_for_network_idle(self, timeout: float) -> bool:
+        pass
+
+    @abstractmethod
+    async def capture_frame(self, settle: float = 0.0, since: Optional[float] = None) -> bytes:
+        pass
+
+    def get_page(self, name: str) -> "BaseBrowserController":
+        # Контроллеры с одной страницей игнорируют имя
+        return self
+
+    async def execute_batch(self, actions: List[Dict], after_action: Optional[Callable[[int, Dict], Awaitable[bool]]] = None) -> int:
+        # Вся последовательность проверяется заранее, чтобы не выполнить половину пакета и упасть на битом действии
+        invalid = [action for action in actions if not is_batchable(action)]
+        if invalid:
+            raise ValueError(f"Action cannot be batched: {invalid[0]}")
+
+        for index, action in enumerate(actions):
+            params = action["params"]
+            if action["action"] == "click_element":
+                await self.click_by_position(params["x"], params["y"])
+            elif action["action"] == "type":
+                await self.type_text(params["text"])
+            else:
+                await self.execute_command(params["command"])
+
+            # after_action может остановить пакет, например если действие не дало ожидаемого эффекта
+            if after_action and not await after_action(index, action):
+                return index + 1
+        return len(actions)
@@ -1,9 +1,15 @@
+import asyncio
+import base64
+import copy
+import hashlib
 import time
 from asyncio import sleep
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional, Set, Union
+from urllib.parse import urlparse
 
-from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+from playwright.async_api import Browser, BrowserContext, CDPSession, Page, Playwright, Route, async_playwright
+from playwright.async_api import Error as PlaywrightError
 
 from browser_controller.base import BaseBrowserController
 from utils.config import CONFIG
@@ -12,20 +18,59 @@ from utils.log import get_logger
 logger = get_logger()
 
 
+def _host_matches(url: str, domains: Iterable[str]) -> bool:
+    host = urlparse(url).hostname or ""
+    return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+
 class PlaywrightController(BaseBrowserController):
-    def __init__(self, headless: bool = True, browser_type: str = "chromium", viewport_size: Dict[str, int] = None):
+    def __init__(
+        self,
+        headless: bool = True,
+        browser_type: str = "chromium",
+        viewport_size: Dict[str, int] = None,
+        block_resource_types: Iterable[str] = (),
+        block_domains: Iterable[str] = (),
+        har_mode: str = "off",
+        har_path: Optional[str] = None,
+        fast_input: bool = False,
+        slow_input_domains: Iterable[str] = (),
+        observation_backend: str = "screenshot",
+        settle_quiet: float = 0.3,
+        screencast_quality: int = 80,
+    ):
         self.headless = headless
         self.browser_type = browser_type
         self.viewport_size = viewport_size or {"width": 1280, "height": 720}
+        self.block_resource_types = set(block_resource_types)
+        self.block_domains = tuple(domain.lstrip(".") for domain in block_domains)
+        self.har_mode = har_mode
+        self.har_path = har_path
+        self.blocked_requests = 0
+        self.fast_input = fast_input
+        self.slow_input_domains = tuple(domain.lstrip(".") for domain in slow_input_domains)
+        self.observation_backend = observation_backend
+        self.settle_quiet = settle_quiet
+        self.screencast_quality = screencast_quality
 
         self.playwright: Optional[Playwright] = None
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        # Именованные страницы одного контекста; все представления страниц разделяют этот словарь
+        self.page_name = "main"
+        self.pages: Dict[str, "PlaywrightController"] = {}
+        self._owns_browser = True
 
-        logger.debug(f"Initialized Playwright controller: {browser_type}, headless={headless}")
+        self._cdp: Optional[CDPSession] = None
+        self._frame: Optional[bytes] = None
+        self._frame_digest: Optional[bytes] = None
+        self._frame_changed_at = 0.0
+        self._ack_tasks: Set[asyncio.Task] = set()
 
-    async def start(self):
+        logger.debug("Initialized Playwright controller: {}, headless={}", browser_type, headless)
+
+    async def start(self, storage_state: Optional[Union[str, Dict]] = None):
         try:
             self.playwright = await async_playwright().start()
 
@@ -44,22 +89,175 @@ class PlaywrightController(BaseBrowserController):
 
             self.context = await self.browser.new_context(
                 viewport=self.viewport_size,
+                storage_state=storage_state,
             )
+            await self._setup_routing()
 
             self.page = await self.context.new_page()
+            self.pages[self.page_name] = self
+
+            if self.observation_backend == "screencast":
+                await self._start_screencast()
 
-            logger.info(f"Browser started: {self.browser_type}")
+            logger.info("Browser started: {}", self.browser_type)
 
         except Exception as e:
-            logger.error(f"Failed to start browser: {e}")
+            logger.error("Failed to start browser: {}", e)
             await self.close()
             raise
 
+    async def _setup_routing(self):
+        if self.har_mode not in ("off", "record", "replay"):
+            raise ValueError(f"Unsupported HAR mode: {self.har_mode}")
+
+        if self.har_mode == "replay" and not (self.har_path and Path(self.har_path).is_file()):
+            logger.warning("HAR file not found, replay disabled: {}", self.har_path)
+        elif self.har_mode != "off":
+            if self.har_mode == "record":
+                Path(self.har_path).parent.mkdir(parents=True, exist_ok=True)
+            # При записи запросы уходят в сеть, а HAR дописывается на закрытии контекста;
+            # при воспроизведении запросы, которых нет в HAR, обрываются, чтобы прогон не зависел от сети
+            recording = self.har_mode == "record"
+            await self.context.route_from_har(self.har_path, not_found="fallback" if recording else "abort", update=recording)
+            logger.info("HAR {}: {}", self.har_mode, self.har_path)
+
+        # Обработчик, зарегистрированный позже, вызывается раньше - блокировка срабатывает до HAR
+        if self.block_resource_types or self.block_domains:
+            await self.context.route("**/*", self._filter_request)
+
+    def _is_blocked(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.block_resource_types:
+            return True
+
+        return _host_matches(url, self.block_domains)
+
+    async def _filter_request(self, route: Route):
+        request = route.request
+        if self._is_blocked(request.resource_type, request.url):
+            self.blocked_requests += 1
+            await route.abort("blockedbyclient")
+        else:
+            await route.fallback()
+
+    async def open_page(self, name: str, url: Optional[str] = None) -> "PlaywrightController":
+        if not self.context:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        if name in self.pages:
+            return self.pages[name]
+
+        view = copy.copy(self)
+        view.page_name = name
+        view._owns_browser = False
+        view._cdp = None
+        view._frame = None
+        view._frame_digest = None
+        view._frame_changed_at = 0.0
+        view._ack_tasks = set()
+        view.page = await self.context.new_page()
+        self.pages[name] = view
+
+        if self.observation_backend == "screencast":
+            await view._start_screencast()
+        if url:
+            await view.navigate_to(url)
+
+        logger.debug("Page opened: {}", name)
+        return view
+
+    def get_page(self, name: str) -> "PlaywrightController":
+        if name not in self.pages:
+            raise KeyError(f"Page not found: {name}")
+
+        return self.pages[name]
+
+    async def _start_screencast(self):
+        if self.browser_type != "chromium":
+            logger.warning("Screencast requires chromium, falling back to screenshots for {}", self.browser_type)
+            return
+
+        self._cdp = await self.context.new_cdp_session(self.page)
+        self._cdp.on("Page.screencastFrame", self._on_screencast_frame)
+        await self._cdp.send(
+            "Page.startScreencast",
+            {
+                "format": "jpeg",
+                "quality": self.screencast_quality,
+                "maxWidth": self.viewport_size["width"],
+                "maxHeight": self.viewport_size["height"],
+            },
+        )
+        logger.debug("Screencast started")
+
+    def _on_screencast_frame(self, params: Dict):
+        data = base64.b64decode(params["data"])
+        digest = hashlib.md5(data).digest()
+        if digest != self._frame_digest:
+            self._frame = data
+            self._frame_digest = digest
+            self._frame_changed_at = time.time()
+
+        # Без ack Chromium перестает присылать новые кадры
+        task = asyncio.create_task(self._ack_screencast_frame(params["sessionId"]))
+        self._ack_tasks.add(task)
+        task.add_done_callback(self._ack_tasks.discard)
+
+    async def _ack_screencast_frame(self, session_id: int):
+        try:
+            await self._cdp.send("Page.screencastFrameAck", {"sessionId": session_id})
+        except PlaywrightError:
+            pass
+
+    @property
+    def screencast_active(self) -> bool:
+        return self._cdp is not None and self._frame is not None
+
+    @property
+    def last_frame_changed_at(self) -> float:
+        return self._frame_changed_at
+
+    def frames_changed_since(self, timestamp: float) -> bool:
+        return self._frame_changed_at > timestamp
+
+    async def wait_for_settle(self, quiet: Optional[float] = None, timeout: float = 1.0) -> bool:
+        quiet = self.settle_quiet if quiet is None else quiet
+        if not self.screencast_active:
+            await sleep(timeout)
+            return True
+
+        started = time.time()
+        deadline = started + timeout
+        while True:
+            # Тишина отсчитывается не раньше момента вызова: сразу после действия новый кадр может еще не прийти
+            idle = time.time() - max(self._frame_changed_at, started)
+            if idle >= quiet:
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            await sleep(min(quiet - idle, remaining))
+
     async def close(self):
         try:
+            if self._owns_browser:
+                for view in [view for view in self.pages.values() if view is not self]:
+                    await view.close()
+
+            if self._cdp:
+                try:
+                    await self._cdp.detach()
+                except PlaywrightError:
+                    pass
+                self._cdp = None
+
             if self.page:
                 await self.page.close()
                 self.page = None
+            self.pages.pop(self.page_name, None)
+
+            if not self._owns_browser:
+                logger.debug("Page closed: {}", self.page_name)
+                return
 
             if self.context:
                 await self.context.close()
@@ -73,10 +271,10 @@ class PlaywrightController(BaseBrowserController):
                 await self.playwright.stop()
                 self.playwright = None
 
-            logger.debug("Browser closed")
+            logger.debug("Browser closed, blocked requests: {}", self.blocked_requests)
 
         except Exception as e:
-            logger.error(f"Error closing browser: {e}")
+            logger.error("Error closing browser: {}", e)
 
     async def navigate_to(self, url: str, wait_until: str = "domcontentloaded"):
         if not self.page:
@@ -84,12 +282,27 @@ class PlaywrightController(BaseBrowserController):
 
         try:
             await self.page.goto(url, wait_until=wait_until)
-            logger.debug(f"Navigated to: {url}")
+            logger.debug("Navigated to: {}", url)
 
         except Exception as e:
-            logger.error(f"Failed to navigate to {url}: {e}")
+            logger.error("Failed to navigate to {}: {}", url, e)
             raise
 
+    def get_url(self) -> str:
+        if not self.page:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        return self.page.url
+
+    async def save_storage_state(self, path: str) -> str:
+        if not self.context:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        await self.context.storage_state(path=path)
+        logger.debug("Storage state saved: {}", path)
+        return path
+
     async def execute_command(self, command: str):
         keyboard = self.page.keyboard
 
@@ -99,7 +312,11 @@ class PlaywrightController(BaseBrowserController):
         try:
             if self.page:
                 keyboard = self.page.keyboard
-                await keyboard.type(text)
+                # insert_text вставляет строку одним событием input; сайтам, которым нужны keydown на каждый символ, оставляем посимвольный ввод
+                if self.fast_input and not _host_matches(self.page.url, self.slow_input_domains):
+                    await keyboard.insert_text(text)
+                else:
+                    await keyboard.type(text)
                 return True
             else:
                 logger.error("Browser page not available for typing")
@@ -113,17 +330,94 @@ class PlaywrightController(BaseBrowserController):
 
         try:
             await self.page.mouse.click(x, y)
-            logger.debug(f"Clicked at position: ({x}, {y})")
+            logger.debug("Clicked at position: ({}, {})", x, y)
 
         except Exception as e:
-            logger.error(f"Failed to click at position ({x}, {y}): {e}")
+            logger.error("Failed to click at position ({}, {}): {}", x, y, e)
             raise
 
+    async def wait_for_text(self, text: str, timeout: float) -> bool:
+        if not self.page:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        try:
+            await self.page.get_by_text(text).first.wait_for(state="visible", timeout=timeout * 1000)
+            return True
+        except PlaywrightError as e:
+            logger.debug("Text '{}' did not appear: {}", text, e)
+            return False
+
+    async def wait_for_element(self, role: str, name: str, timeout: float) -> bool:
+        if not self.page:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        try:
+            await self.page.get_by_role(role, name=name).first.wait_for(state="visible", timeout=timeout * 1000)
+            return True
+        except PlaywrightError as e:
+            logger.debug("Element {} '{}' did not appear: {}", role, name, e)
+            return False
+
+    async def wait_for_url(self, url_contains: str, timeout: float) -> bool:
+        if not self.page:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        start_url = self.page.url
+        try:
+            await self.page.wait_for_url(
+                lambda url: url_contains in url if url_contains else url != start_url, wait_until="domcontentloaded", timeout=timeout * 1000
+            )
+            return True
+        except PlaywrightError as e:
+            logger.debug("URL did not change from {}: {}", start_url, e)
+            return False
+
+    async def wait_for_network_idle(self, timeout: float) -> bool:
+        if not self.page:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        try:
+            await self.page.wait_for_load_state("networkidle", timeout=timeout * 1000)
+            return True
+        except PlaywrightError as e:
+            logger.debug("Network did not become idle: {}", e)
+            return False
+
+    async def capture_frame(self, settle: float = 0.0, since: Optional[float] = None) -> bytes:
+        if not self.page:
+            raise RuntimeError("Browser not started. Call start() first.")
+
+        if self.screencast_active:
+            if settle:
+                await self.wait_for_settle(quiet=settle, timeout=settle + 1.0)
+            # A frame older than `since` may predate the action: without newer frames, take a real screenshot
+            if since is None or self.frames_changed_since(since):
+                return self._frame
+            return await self.page.screenshot()
+
+        if settle:
+            await sleep(settle)
+        return await self.page.screenshot()
+
     async def get_screenshot(self, path: Optional[str] = None, full_page: bool = False, save_to_disk: bool = True) -> str:
         if not self.page:
             raise RuntimeError("Browser not started. Call start() first.")
 
         try:
+            if not save_to_disk and not full_page and self.screencast_active:
+                # Последний кадр скринкаста уже в памяти: ждем только пока экран перестанет меняться
+                started = time.time()
+                await self.wait_for_settle(timeout=self.settle_quiet + 1.0)
+                # Кадр, пришедший до вызова, может показывать экран до действия: если новых кадров не было, снимаем экран заново
+                if self.frames_changed_since(started):
+                    frame, suffix = self._frame, "jpg"
+                else:
+                    frame, suffix = await self.page.screenshot(), "png"
+                temp_path = f"/tmp/temp_screenshot_{int(time.time())}.{suffix}"
+                with open(temp_path, "wb") as f:
+                    f.write(frame)
+                return temp_path
+
             await sleep(1)
             if path is None:
                 screenshots_dir = Path(CONFIG.output_dir)
@@ -132,7 +426,7 @@ class PlaywrightController(BaseBrowserController):
 
             if save_to_disk:
                 await self.page.screenshot(path=path, full_page=full_page)
-                logger.debug(f"Screenshot saved: {path}")
+                logger.debug("Screenshot saved: {}", path)
                 return path
             else:
                 # Возвращаем временный путь для encode_image, но не сохраняем на диск
@@ -143,5 +437,5 @@ class PlaywrightController(BaseBrowserController):
                 return temp_path
 
         except Exception as e:
-            logger.error(f"Failed to take screenshot: {e}")
+            logger.error("Failed to take screenshot: {}", e)
             raise
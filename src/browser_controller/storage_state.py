@@ -0,0 +1,67 @@
+import json
+import re
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from browser_controller.playwright_controller import PlaywrightController
+from utils.log import get_logger
+
+logger = get_logger()
+
+DISABLED_KEYS = ("off", "none", "false")
+
+
+class StorageStateStore:
+    def __init__(self, directory: str, ttl: int):
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    @staticmethod
+    def resolve_key(url: str, session: Optional[str] = None) -> Optional[str]:
+        if session and session.lower() in DISABLED_KEYS:
+            return None
+
+        key = session or urlparse(url).hostname or ""
+        if key.startswith("www."):
+            key = key[4:]
+        return re.sub(r"[^\w.-]", "_", key) or None
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def load(self, key: str) -> Optional[Dict]:
+        path = self.path(key)
+        if not path.is_file():
+            return None
+
+        if time.time() - path.stat().st_mtime > self.ttl:
+            logger.info("Storage state expired: {}", key)
+            self.invalidate(key)
+            return None
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning("Failed to read storage state {}: {}", path, e)
+            self.invalidate(key)
+            return None
+
+        # Просроченные cookies сайт всё равно не примет, а без них логин обычно не переживает
+        now = time.time()
+        state["cookies"] = [cookie for cookie in state.get("cookies", []) if cookie.get("expires", -1) <= 0 or cookie["expires"] > now]
+        if not state["cookies"] and not state.get("origins"):
+            self.invalidate(key)
+            return None
+
+        logger.info("Storage state loaded: {} ({} cookies)", key, len(state["cookies"]))
+        return state
+
+    async def save(self, browser: PlaywrightController, key: str) -> None:
+        await browser.save_storage_state(str(self.path(key)))
+        logger.info("Storage state saved: {}", key)
+
+    def invalidate(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
@@ -1,25 +1,104 @@
-import asyncio
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
 
-from agent_runner import run_all_tasks
 from utils.config import CONFIG
-from utils.log import get_logger
-from utils.result_formatter import format_final_output, save_results
-from utils.task_parser import task_parse
+from utils.log import LoggingFormat, get_logger, log_event, setup_logger
+from utils.task_parser import TaskParseError, task_parse
 
 log = get_logger()
 
 
-async def run_agent():
-    task_data = task_parse(CONFIG.task_file_path)
-    log.info(f"Загружена задача: {task_data.url}")
-    log.info(f"Количество шагов: {len(task_data.tasks)}")
+async def run_agent(task_file_path: Optional[str] = None):
+    # Граф, браузер и клиент LLM нужны только для запуска - импортируем их здесь, а не при старте CLI
+    from agent.llm_gateway import get_gateway
+    from agent_runner import run_all_tasks
+    from utils.result_formatter import format_final_output, save_results
+
+    setup_logger(CONFIG.log.level, LoggingFormat(CONFIG.log.format.upper()), CONFIG.log.dir or None)
+
+    task_data = task_parse(task_file_path or CONFIG.task_file_path)
+    log.info("Загружена задача: {}", task_data.url)
+    log.info("Количество шагов: {}", len(task_data.tasks))
 
     metrics, verification = await run_all_tasks(task_data)
-    metrics.finish()
 
     output_text = format_final_output(verification, metrics.get_history(), metrics.total_time)
     save_results(output_text)
+    log_event("llm_gateway_stats", **get_gateway().stats())
+    await log.complete()
+
+
+def validate_task_files(paths: List[str]) -> int:
+    failed = 0
+    for path in paths:
+        try:
+            task_data = task_parse(path)
+            print(f"OK    {path}: {task_data.url}, шагов: {len(task_data.tasks)}")
+        except TaskParseError as e:
+            failed += 1
+            print(f"ERROR {path}: {e}")
+    return 1 if failed else 0
+
+
+def list_suite(directory: str, pattern: str) -> int:
+    paths = sorted(str(path) for path in Path(directory).glob(pattern) if path.is_file())
+    if not paths:
+        print(f"Файлы задач не найдены: {directory}/{pattern}")
+        return 1
+    return validate_task_files(paths)
+
+
+def aggregate(paths: List[str]) -> int:
+    import json
+
+    from utils.result_aggregator import aggregate_results
+
+    print(json.dumps(aggregate_results(paths), ensure_ascii=False, indent=2))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Web Agent")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="выполнить файл задач (по умолчанию)")
+    run_parser.add_argument("task_file", nargs="?", help="путь к файлу задач, по умолчанию TASK_FILE_PATH")
+
+    validate_parser = subparsers.add_parser("validate", help="проверить формат файлов задач")
+    validate_parser.add_argument("task_files", nargs="+")
+
+    list_parser = subparsers.add_parser("list", help="показать файлы задач в директории")
+    list_parser.add_argument("directory")
+    list_parser.add_argument("--pattern", default="*.txt")
+
+    aggregate_parser = subparsers.add_parser("aggregate", help="сводка по JSONL-файлам результатов: pass rate и перцентили времени")
+    aggregate_parser.add_argument("result_files", nargs="+")
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "validate":
+        return validate_task_files(args.task_files)
+    if args.command == "list":
+        return list_suite(args.directory, args.pattern)
+    if args.command == "aggregate":
+        return aggregate(args.result_files)
+
+    import asyncio
+
+    task_file = getattr(args, "task_file", None) or CONFIG.task_file_path
+    if not task_file:
+        parser.error("не указан файл задач: передайте его аргументом run или задайте TASK_FILE_PATH")
+
+    asyncio.run(run_agent(task_file))
+    return 0
 
 
 if __name__ == "__main__":
-    asyncio.run(run_agent())
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from utils.config import BudgetConfig
+from utils.log import get_logger
+
+log = get_logger()
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RunBudget:
+    def __init__(self, step_timeout: float = 0, scenario_timeout: float = 0, max_llm_calls: int = 0, max_actions: int = 0):
+        # 0 означает отсутствие ограничения
+        self.step_timeout = step_timeout
+        self.scenario_deadline = time.time() + scenario_timeout if scenario_timeout else None
+        self.max_llm_calls = max_llm_calls
+        self.max_actions = max_actions
+        self.llm_calls = 0
+        self.actions = 0
+        # Дедлайн текущего блока scope(): по нему можно приоритизировать запросы. Хранится в ContextVar,
+        # потому что параллельные шаги открывают scope() одного бюджета одновременно в разных задачах
+        self._active_deadline: ContextVar[Optional[float]] = ContextVar(f"active_deadline_{id(self)}", default=None)
+
+    @property
+    def active_deadline(self) -> Optional[float]:
+        return self._active_deadline.get() or self.scenario_deadline
+
+    @classmethod
+    def from_config(cls, config: BudgetConfig) -> "RunBudget":
+        return cls(config.step_timeout, config.scenario_timeout, config.max_llm_calls, config.max_actions)
+
+    def count_llm_call(self) -> None:
+        self.llm_calls += 1
+        if self.max_llm_calls and self.llm_calls > self.max_llm_calls:
+            raise BudgetExceeded(f"Превышен лимит вызовов LLM: {self.max_llm_calls}")
+
+    def count_action(self, count: int = 1) -> None:
+        self.actions += count
+        if self.max_actions and self.actions > self.max_actions:
+            raise BudgetExceeded(f"Превышен лимит действий: {self.max_actions}")
+
+    def remaining_actions(self) -> Optional[int]:
+        return max(0, self.max_actions - self.actions) if self.max_actions else None
+
+    @asynccontextmanager
+    async def scope(self, with_step: bool = True):
+        """Отменяет все ожидания браузера и LLM внутри блока, когда истекает дедлайн шага или сценария."""
+        now = time.time()
+        step_deadline = now + self.step_timeout if with_step and self.step_timeout else None
+        deadline = min((d for d in (self.scenario_deadline, step_deadline) if d), default=None)
+        if deadline and deadline <= now:
+            raise BudgetExceeded("Превышен дедлайн сценария")
+
+        token = self._active_deadline.set(deadline)
+        timeout = asyncio.timeout(deadline - now if deadline else None)
+        try:
+            async with timeout:
+                yield self
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            reason = f"Превышен дедлайн шага: {self.step_timeout:.0f}с" if deadline == step_deadline else "Превышен дедлайн сценария"
+            log.warning(reason)
+            raise BudgetExceeded(reason) from None
+        finally:
+            self._active_deadline.reset(token)
@@ -0,0 +1,73 @@
+import json
+import shutil
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+from utils.execution_tracker import StepResult
+from utils.log import get_logger
+from utils.task_parser import TaskData
+
+log = get_logger()
+
+
+@dataclass
+class RunProgress:
+    steps: List[StepResult] = field(default_factory=list)
+    url: Optional[str] = None
+    storage_state_path: Optional[str] = None
+
+    @property
+    def completed_steps(self) -> int:
+        return len(self.steps)
+
+
+class RunCheckpoint:
+    def __init__(self, run_id: str, directory: str):
+        self.run_id = run_id
+        self.run_dir = Path(directory) / run_id
+        self.progress_path = self.run_dir / "progress.json"
+
+    @classmethod
+    def for_task(cls, task_data: TaskData, directory: str) -> "RunCheckpoint":
+        return cls(task_data.scenario_id, directory)
+
+    def thread_id(self, step_num: int) -> str:
+        return f"{self.run_id}:{step_num}"
+
+    def storage_state_path(self, step_num: int) -> str:
+        return str(self.run_dir / f"step_{step_num}_storage.json")
+
+    def load(self) -> RunProgress:
+        if not self.progress_path.is_file():
+            return RunProgress()
+
+        try:
+            with open(self.progress_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            progress = RunProgress(
+                steps=[StepResult(**step) for step in data.get("steps", [])],
+                url=data.get("url"),
+                storage_state_path=data.get("storage_state_path"),
+            )
+        except Exception as e:
+            log.warning("Не удалось прочитать чекпоинт {}: {}", self.progress_path, e)
+            return RunProgress()
+
+        if progress.storage_state_path and not Path(progress.storage_state_path).is_file():
+            progress.storage_state_path = None
+        return progress
+
+    def save(self, progress: RunProgress) -> None:
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        data = {"steps": [asdict(step) for step in progress.steps], "url": progress.url, "storage_state_path": progress.storage_state_path}
+
+        # Пишем через временный файл, чтобы прерванный запуск не оставил битый progress.json
+        tmp_path = self.progress_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.progress_path)
+        log.debug("Чекпоинт сохранен: {}", self.progress_path)
+
+    def clear(self) -> None:
+        shutil.rmtree(self.run_dir, ignore_errors=True)
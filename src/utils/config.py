@@ -1,9 +1,6 @@
 import os
 from dataclasses import dataclass, field, fields, is_dataclass
-
-from dotenv import load_dotenv
-
-load_dotenv()
+from functools import lru_cache
 
 
 @dataclass
@@ -13,13 +10,113 @@ class GPTConfig:
     model: str
 
 
+@dataclass
+class CheckpointConfig:
+    enabled: bool = field(default=False)
+    resume: bool = field(default=False)
+    dir: str = field(default="./output/checkpoints")
+
+
+@dataclass
+class StorageStateConfig:
+    enabled: bool = field(default=False)
+    dir: str = field(default="./output/storage_state")
+    ttl: int = field(default=86400)
+
+
+@dataclass
+class NetworkConfig:
+    # Списки через запятую, например "image,media,font" и "doubleclick.net,mc.yandex.ru"
+    block_resource_types: str = field(default="")
+    block_domains: str = field(default="")
+    # off - сеть как есть, record - записать ответы в HAR, replay - отдавать ответы из HAR
+    har_mode: str = field(default="off")
+    har_path: str = field(default="./output/network.har")
+
+
+@dataclass
+class ClickZoomConfig:
+    enabled: bool = field(default=False)
+    tile_size: int = field(default=240)
+    scale: int = field(default=3)
+
+
+@dataclass
+class InputConfig:
+    fast: bool = field(default=False)
+    # Домены через запятую, где нужен посимвольный ввод (автодополнение на keydown)
+    slow_domains: str = field(default="")
+    batch_actions: bool = field(default=False)
+
+
+@dataclass
+class ObservationConfig:
+    # screenshot - page.screenshot на каждое наблюдение, screencast - последний кадр CDP-скринкаста (только chromium)
+    backend: str = field(default="screenshot")
+    settle_quiet_ms: int = field(default=300)
+    screencast_quality: int = field(default=80)
+    # prefetch - снимать кадр для решения сразу после последнего действия, speculative - начинать решение по первому кадру
+    prefetch: bool = field(default=False)
+    speculative: bool = field(default=False)
+    settle_timeout_ms: int = field(default=1000)
+
+
+@dataclass
+class BudgetConfig:
+    # Секунды и количества; 0 - без ограничения
+    step_timeout: int = field(default=0)
+    scenario_timeout: int = field(default=0)
+    max_llm_calls: int = field(default=0)
+    max_actions: int = field(default=0)
+
+
+@dataclass
+class LogConfig:
+    level: str = field(default="INFO")
+    # CONSOLE или JSON
+    format: str = field(default="CONSOLE")
+    # Директория для events.<pid>.jsonl со структурированными событиями запуска; пусто - не писать
+    dir: str = field(default="./output/logs")
+
+
+@dataclass
+class EffectConfig:
+    enabled: bool = field(default=False)
+    # Доли изменившихся пикселей: клик, изменивший меньше noop_threshold и во всем кадре, и рядом с точкой клика, считается холостым;
+    # больше diverge_threshold во всем кадре - экран сменился неожиданно
+    noop_threshold: float = field(default=0.001)
+    diverge_threshold: float = field(default=0.5)
+    settle_ms: int = field(default=300)
+
+
+@dataclass
+class GatewayConfig:
+    # Общие для всех запусков процесса лимиты на вызовы LLM; 0 - без ограничения
+    max_concurrency: int = field(default=0)
+    requests_per_minute: int = field(default=0)
+    burst: int = field(default=5)
+    # Одинаковые одновременные запросы (промпт и кадр) отправляются в модель один раз
+    coalesce: bool = field(default=True)
+
+
 @dataclass
 class Config:
-    task_file_path: str
     playwright_headless: bool
     gpt: GPTConfig
+    # Файл задач можно передать аргументом main.py run, тогда переменная не нужна
+    task_file_path: str = field(default="")
     output_dir: str = field(default="./output")
     debug: bool = field(default=False)
+    checkpoint: CheckpointConfig = field(default_factory=CheckpointConfig)
+    storage_state: StorageStateConfig = field(default_factory=StorageStateConfig)
+    network: NetworkConfig = field(default_factory=NetworkConfig)
+    click_zoom: ClickZoomConfig = field(default_factory=ClickZoomConfig)
+    input: InputConfig = field(default_factory=InputConfig)
+    observation: ObservationConfig = field(default_factory=ObservationConfig)
+    budget: BudgetConfig = field(default_factory=BudgetConfig)
+    log: LogConfig = field(default_factory=LogConfig)
+    effect: EffectConfig = field(default_factory=EffectConfig)
+    gateway: GatewayConfig = field(default_factory=GatewayConfig)
 
 
 class ConfigLoader:
@@ -49,10 +146,30 @@ class ConfigLoader:
                         val = False
                     else:
                         raise ValueError(f"Env variable '{field_name}'={val} не может быть преобразована в bool")
+                elif field.type in (int, float):
+                    try:
+                        val = field.type(val)
+                    except ValueError:
+                        raise ValueError(f"Env variable '{field_name}'={val} не может быть преобразована в {field.type.__name__}") from None
 
                 kwargs[field.name] = val
 
         return cls(**kwargs)
 
 
-CONFIG: Config = ConfigLoader().load_config()
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return ConfigLoader().load_config()
+
+
+class _LazyConfig:
+    # Конфиг читается из окружения при первом обращении к полю, а не при импорте:
+    # быстрые команды CLI не требуют GPT_* и прочих переменных
+    def __getattr__(self, name: str):
+        return getattr(get_config(), name)
+
+
+CONFIG: Config = _LazyConfig()  # type: ignore[assignment]
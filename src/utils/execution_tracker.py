@@ -1,6 +1,6 @@
 import time
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 
 
 @dataclass
@@ -12,6 +12,9 @@ class StepResult:
     execution_time: float
     error: str = None
     actions: List[str] = field(default_factory=list)
+    stop_reason: str = None
+    # Шаг восстановлен из чекпоинта прошлого запуска, а не выполнен в текущем
+    resumed: bool = False
 
 
 @dataclass
@@ -20,9 +23,13 @@ class ExecutionMetrics:
     steps: List[StepResult] = field(default_factory=list)
     total_time: float = 0.0
     success: bool = False
+    # Вызывается сразу по завершении шага, например для потоковой записи результатов
+    on_step: Optional[Callable[[StepResult], None]] = field(default=None, repr=False)
 
     def add_step(self, result: StepResult):
         self.steps.append(result)
+        if self.on_step:
+            self.on_step(result)
 
     def finish(self):
         self.total_time = time.time() - self.start_time
@@ -39,8 +46,19 @@ class ExecutionMetrics:
         return history
 
 
-def create_step_result(step_num: int, total_steps: int, task: str, agent_result: Dict, execution_time: float) -> StepResult:
-    if agent_result.get("error"):
+def create_step_result(step_num: int, total_steps: int, task: str, agent_result: Dict, execution_time: float, stop_reason: str = None) -> StepResult:
+    if stop_reason:
+        return StepResult(
+            step_num=step_num,
+            total_steps=total_steps,
+            task=task,
+            success=False,
+            execution_time=execution_time,
+            error=stop_reason,
+            actions=agent_result.get("history", []),
+            stop_reason=stop_reason,
+        )
+    elif agent_result.get("error"):
         return StepResult(step_num=step_num, total_steps=total_steps, task=task, success=False, execution_time=execution_time, error=agent_result["error"])
     else:
         return StepResult(
@@ -0,0 +1,40 @@
+import io
+from typing import Optional, Tuple
+
+# Кадры сравниваются в уменьшенном виде: так дешевле и не реагирует на шум JPEG и сглаживание шрифтов
+_DIFF_WIDTH = 160
+_PIXEL_THRESHOLD = 24
+# Сторона квадрата вокруг точки действия, который сравнивается в исходном разрешении
+_REGION_SIZE = 96
+
+
+def frame_diff(before: bytes, after: bytes, around: Optional[Tuple[int, int]] = None) -> float:
+    """Доля пикселей, заметно изменившихся между двумя кадрами (0.0 - 1.0).
+
+    По умолчанию сравнивается весь кадр в уменьшенном виде. С around - только квадрат вокруг точки
+    в исходном разрешении: мелкие изменения (галочка чекбокса, фокус поля) на всем кадре теряются.
+    """
+    if before == after:
+        return 0.0
+
+    from PIL import Image, ImageChops
+
+    with Image.open(io.BytesIO(before)) as first, Image.open(io.BytesIO(after)) as second:
+        if first.size != second.size:
+            return 1.0
+
+        if around:
+            half = _REGION_SIZE // 2
+            left = max(0, min(around[0] - half, first.width - _REGION_SIZE))
+            top = max(0, min(around[1] - half, first.height - _REGION_SIZE))
+            box = (left, top, min(left + _REGION_SIZE, first.width), min(top + _REGION_SIZE, first.height))
+            first_small = first.convert("L").crop(box)
+            second_small = second.convert("L").crop(box)
+        else:
+            height = max(1, first.height * _DIFF_WIDTH // first.width)
+            first_small = first.convert("L").resize((_DIFF_WIDTH, height))
+            second_small = second.convert("L").resize((_DIFF_WIDTH, height))
+
+    diff = ImageChops.difference(first_small, second_small).point(lambda value: 255 if value > _PIXEL_THRESHOLD else 0)
+    changed = diff.histogram()[255]
+    return changed / (first_small.width * first_small.height)
@@ -1,6 +1,8 @@
+import json
 import logging
 import os
 import sys
+from datetime import timezone
 from enum import Enum
 from typing import Any, Dict, Optional, Union
 
@@ -24,40 +26,42 @@ def inv_analytics_filter(record: Dict[str, Any]) -> bool:
     return not record.get("extra", {}).get("analytics", False)
 
 
+def jsonl_event_format(record: Dict[str, Any]) -> str:
+    """Аналитическое событие одной JSON-строкой: время, имя события и все поля из extra (run_id, scenario_id, step, ...)."""
+    event = {"time": record["time"].astimezone(timezone.utc).isoformat(), "event": record["message"]}
+    event.update((key, value) for key, value in record["extra"].items() if key not in ("analytics", "_jsonl"))
+    # loguru подставляет поля записи в строку формата, поэтому готовый JSON передается через extra, а не самой строкой
+    record["extra"]["_jsonl"] = json.dumps(event, ensure_ascii=False, default=str)
+    return "{extra[_jsonl]}\n"
+
+
 def setup_logger(level: str = "INFO", fmt: LoggingFormat = LoggingFormat.CONSOLE, log_folder: Optional[str] = None):
     log_level: Union[int, str] = logging.getLevelName(level.upper())
     if not isinstance(log_level, int):
         log_level = logging.INFO
 
+    # enqueue=True: запись идет из отдельного потока, логирование не блокирует event loop
     if fmt == LoggingFormat.JSON and os.getenv("LOG_SANE", "0").lower() == "0":  # better debugging github_app
         logger.remove(None)
-        logger.add(
-            sys.stdout,
-            level=log_level,
-            format="{message}",
-            colorize=False,
-            serialize=True,
-            filter=lambda record: not record.get("extra", {}).get("analytics", False),
-        )
+        logger.add(sys.stdout, level=log_level, format="{message}", colorize=False, serialize=True, enqueue=True, filter=inv_analytics_filter)
     elif fmt == LoggingFormat.CONSOLE:  # does not print the 'extra' fields
         logger.remove(None)
-        logger.add(sys.stdout, level=log_level, colorize=True, filter=lambda record: not record.get("extra", {}).get("analytics", False))
+        logger.add(sys.stdout, level=log_level, colorize=True, enqueue=True, filter=inv_analytics_filter)
 
     if log_folder:
         pid = os.getpid()
-        log_file = os.path.join(log_folder, f"app.{pid}.log")
-        logger.add(
-            log_file,
-            level=log_level,
-            format="{message}",
-            colorize=False,
-            serialize=True,
-            filter=lambda record: record.get("extra", {}).get("analytics", False),
-        )
+        log_file = os.path.join(log_folder, f"events.{pid}.jsonl")
+        # Файловый sink loguru сам создает директорию и закрывает файл в logger.remove() и при выходе
+        logger.add(log_file, format=jsonl_event_format, level=log_level, enqueue=True, filter=analytics_filter)
 
     return logger
 
 
+def log_event(event: str, **fields: Any) -> None:
+    """Структурированное событие запуска; run_id и scenario_id берутся из logger.contextualize()."""
+    logger.bind(analytics=True, **fields).info(event)
+
+
 def get_logger(*_args: Any, **_kwargs: Any):
     """Get logger instance (compatibility function)"""
     return logger
@@ -0,0 +1,63 @@
+import json
+import math
+from typing import Dict, Iterable, List
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
+
+
+def aggregate_results(paths: Iterable[str]) -> Dict:
+    runs = 0
+    completed_runs = 0
+    passed_runs = 0
+    run_times: List[float] = []
+    step_times: List[float] = []
+    steps_passed = 0
+    stop_reasons: Dict[str, int] = {}
+
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+
+        runs += len({record["run_id"] for record in records})
+        for record in records:
+            if record["type"] == "step":
+                # Шаги, восстановленные из чекпоинта, уже учтены в файле запуска, где они выполнялись
+                if record.get("resumed"):
+                    continue
+                step_times.append(record["execution_time"])
+                steps_passed += 1 if record["success"] else 0
+                if record.get("stop_reason"):
+                    stop_reasons[record["stop_reason"]] = stop_reasons.get(record["stop_reason"], 0) + 1
+            elif record["type"] == "summary":
+                # Запуск без сводки оборвался на середине: его шаги учитываем, а в pass rate запусков он не входит
+                completed_runs += 1
+                passed_runs += 1 if record["success"] else 0
+                run_times.append(record["total_time"])
+
+    return {
+        "runs": runs,
+        "completed_runs": completed_runs,
+        "run_pass_rate": passed_runs / completed_runs if completed_runs else 0.0,
+        "steps": len(step_times),
+        "step_pass_rate": steps_passed / len(step_times) if step_times else 0.0,
+        "run_time": latency_stats(run_times),
+        "step_time": latency_stats(step_times),
+        "stop_reasons": stop_reasons,
+    }
@@ -30,4 +30,4 @@ def save_results(output_text: str) -> None:
     with open(result_filename, "w", encoding="utf-8") as f:
         f.write(output_text)
 
-    log.info(f"Результаты сохранены в: {result_filename}")
+    log.info("Результаты сохранены в: {}", result_filename)
@@ -0,0 +1,53 @@
+import json
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict
+
+from utils.execution_tracker import ExecutionMetrics, StepResult
+from utils.log import get_logger
+
+log = get_logger()
+
+
+class ResultStream:
+    """JSONL-отчет запуска: запись на каждый шаг сразу по завершении, затем проверка результата и итоговая сводка."""
+
+    def __init__(self, path: str, run_id: str, scenario_id: str):
+        self.path = path
+        self.run_id = run_id
+        self.scenario_id = scenario_id
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def open(cls, output_dir: str, run_id: str, scenario_id: str) -> "ResultStream":
+        return cls(f"{output_dir}/result_{int(time.time())}_{run_id}.jsonl", run_id, scenario_id)
+
+    def _write(self, record_type: str, **fields) -> None:
+        record = {"type": record_type, "run_id": self.run_id, "scenario_id": self.scenario_id, "time": time.time(), **fields}
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            log.warning("Не удалось записать результат в {}: {}", self.path, e)
+
+    def write_run(self, url: str, total_steps: int) -> None:
+        self._write("run", url=url, total_steps=total_steps)
+
+    def write_step(self, step: StepResult) -> None:
+        self._write("step", **asdict(step))
+
+    def write_verification(self, verification: Dict) -> None:
+        self._write("verification", **verification)
+
+    def write_summary(self, metrics: ExecutionMetrics, verification: Dict) -> None:
+        passed = sum(1 for step in metrics.steps if step.success)
+        self._write(
+            "summary",
+            success=verification["success"],
+            total_time=metrics.total_time,
+            steps_completed=len(metrics.steps),
+            steps_passed=passed,
+            steps_failed=len(metrics.steps) - passed,
+            stop_reason=next((step.stop_reason for step in metrics.steps if step.stop_reason), None),
+        )
@@ -1,6 +1,10 @@
+import hashlib
+import json
 import os
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+PARALLEL_MARKER = "||"
 
 
 @dataclass
@@ -8,6 +12,26 @@ class TaskData:
     url: str
     tasks: List[str]
     result: str
+    # Ключ сохраненного состояния браузера (cookies, localStorage): None - по домену url, "off" - не использовать
+    session: Optional[str] = None
+    # Шаги с маркером "||" выполняются параллельно с соседними такими же шагами на отдельных страницах
+    parallel: List[bool] = field(default_factory=list)
+
+    @property
+    def scenario_id(self) -> str:
+        # Один и тот же файл задач всегда дает один и тот же идентификатор
+        payload = json.dumps([self.url, self.tasks, self.result], ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+    def step_groups(self) -> List[List[int]]:
+        parallel = self.parallel + [False] * (len(self.tasks) - len(self.parallel))
+        groups: List[List[int]] = []
+        for step_num in range(1, len(self.tasks) + 1):
+            if step_num > 1 and parallel[step_num - 1] and parallel[step_num - 2]:
+                groups[-1].append(step_num)
+            else:
+                groups.append([step_num])
+        return groups
 
 
 class TaskParseError(Exception):
@@ -32,20 +56,28 @@ def task_parse(file_path: str) -> TaskData:
 
         url = None
         tasks = []
+        parallel = []
         result = None
+        session = None
 
         for line in lines:
             if line.startswith("url:"):
                 url = line.replace("url:", "").strip()
             elif line.startswith("result:"):
                 result = line.replace("result:", "").strip()
-            elif line and not line.startswith("url:") and not line.startswith("result:"):
+            elif line.startswith("session:"):
+                session = line.replace("session:", "").strip() or None
+            elif line:
                 # Убираем номера задач если есть (1., 2., и т.д.)
                 task = line
                 if ". " in task and task.split(".")[0].strip().isdigit():
                     task = ".".join(task.split(".")[1:]).strip()
+                is_parallel = task.startswith(PARALLEL_MARKER)
+                if is_parallel:
+                    task = task[len(PARALLEL_MARKER) :].strip()
                 if task:
                     tasks.append(task)
+                    parallel.append(is_parallel)
 
         if not url:
             raise TaskParseError(f"Не найден URL в файле: {file_path}. Формат: url: https://example.com")
@@ -56,7 +88,7 @@ def task_parse(file_path: str) -> TaskData:
         if not result:
             raise TaskParseError(f"Не найден результат в файле: {file_path}. Формат: result: Ожидаемый результат")
 
-        return TaskData(url=url, tasks=tasks, result=result)
+        return TaskData(url=url, tasks=tasks, result=result, session=session, parallel=parallel)
 
     except UnicodeDecodeError:
         raise TaskParseError(f"Ошибка кодировки файла: {file_path}. Файл должен быть в UTF-8")